@@ -1,40 +1,92 @@
 import os
 import re
+import sys
 import asyncio
 import logging
-from datetime import datetime
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from functools import lru_cache
 from typing import Optional, Tuple
 
 import aiohttp
 import aiosqlite
+import orjson
+from aiolimiter import AsyncLimiter
 from aiohttp import web
+from aiohttp.resolver import AsyncResolver
 
 from aiogram import Bot, Dispatcher, F
+from aiogram.exceptions import TelegramRetryAfter
 from aiogram.filters import CommandStart, Command
 from aiogram.types import Message
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 # ----------------------------
 # CONFIG
 # ----------------------------
-BOT_TOKEN = (os.getenv("BOT_TOKEN") or "").strip()
-CHECK_INTERVAL_MINUTES = int((os.getenv("CHECK_INTERVAL_MINUTES") or "15").strip())
-DB_PATH = (os.getenv("DB_PATH") or "data.sqlite3").strip()
-PORT = int((os.getenv("PORT") or "10000").strip())
+def _env_str(name: str, default: str) -> str:
+    return (os.getenv(name) or "").strip() or default
 
-if not BOT_TOKEN:
-    raise RuntimeError("BOT_TOKEN is missing. Set it in Render Environment Variables.")
+def _env_int(name: str, default: int) -> int:
+    raw = _env_str(name, str(default))
+    try:
+        value = int(raw)
+    except ValueError:
+        raise RuntimeError(f"{name} must be an integer, got {raw!r}.") from None
+    if value <= 0:
+        raise RuntimeError(f"{name} must be positive, got {value}.")
+    return value
+
+@dataclass(frozen=True)
+class Config:
+    bot_token: str
+    check_interval_minutes: int
+    db_path: str
+    port: int
+    check_concurrency: int
+    check_batch_limit: int
+    baskets_path: str
+    health_server: str  # "tcp" (bare asyncio listener) or "aiohttp" (full web app, handy in dev)
+
+    @classmethod
+    def from_env(cls) -> "Config":
+        bot_token = _env_str("BOT_TOKEN", "")
+        if not bot_token:
+            raise RuntimeError("BOT_TOKEN is missing. Set it in Render Environment Variables.")
+        return cls(
+            bot_token=bot_token,
+            check_interval_minutes=_env_int("CHECK_INTERVAL_MINUTES", 15),
+            db_path=_env_str("DB_PATH", "data.sqlite3"),
+            port=_env_int("PORT", 10000),
+            check_concurrency=_env_int("CHECK_CONCURRENCY", 16),
+            check_batch_limit=_env_int("CHECK_BATCH_LIMIT", 500),
+            baskets_path=_env_str("BASKETS_PATH", "baskets.json"),
+            health_server=_env_str("HEALTH_SERVER", "tcp").lower(),
+        )
+
+CFG = Config.from_env()
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger("saleohota")
 
 UA = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122 Safari/537.36"
 
+# shared HTTP session (created in main(), keeps connection pool / keep-alive between calls)
+SESSION: Optional[aiohttp.ClientSession] = None
+
 # ----------------------------
 # WB FETCH (FIX: no card.wb.ru)
 # ----------------------------
-BASKETS = [f"basket-{i:02d}.wb.ru" for i in range(1, 21)]  # 01..20
+BASKETS = tuple(f"basket-{i:02d}.wb.ru" for i in range(1, 21))  # 01..20
+_BASKET_ORIGIN = {host: "https://" + host for host in BASKETS}
 
+_WB_PRODUCT_PREFIX = "https://www.wildberries.ru/catalog/"
+
+_WB_URL_RE = re.compile(r"wildberries\.ru/catalog/(\d+)")
+_DIGITS_RE = re.compile(r"\b(\d{6,12})\b")
+
+@lru_cache(maxsize=4096)
 def extract_wb_nm(text: str) -> Optional[int]:
     """
     Accepts:
@@ -46,51 +98,434 @@ def extract_wb_nm(text: str) -> Optional[int]:
         return None
     t = text.strip()
 
-    m = re.search(r"wildberries\.ru/catalog/(\d+)", t)
-    if m:
-        return int(m.group(1))
+    # most common input is a bare article: plain str check, no regex
+    if t.isascii() and t.isdigit() and 6 <= len(t) <= 12:
+        return int(t)
+
+    # cheap substring check before running the regex
+    if "wildberries.ru/catalog/" in t:
+        m = _WB_URL_RE.search(t)
+        if m:
+            return int(m.group(1))
 
-    m = re.search(r"\b(\d{6,12})\b", t)
+    m = _DIGITS_RE.search(t)
     if m:
         return int(m.group(1))
 
     return None
 
-def wb_card_urls(nm: int) -> list[str]:
+def wb_card_path(nm: int) -> str:
     vol = nm // 1_000_000
     part = nm // 1_000
-    path = f"/vol{vol}/part{part}/{nm}/info/ru/card.json"
-    return [f"https://{host}{path}" for host in BASKETS]
+    return f"/vol{vol}/part{part}/{nm}/info/ru/card.json"
 
-async def fetch_wb_card(nm: int, session: aiohttp.ClientSession) -> dict:
-    last_err = None
-    for url in wb_card_urls(nm):
-        try:
-            async with session.get(url, headers={"User-Agent": UA}, timeout=aiohttp.ClientTimeout(total=12)) as r:
-                if r.status == 200:
-                    return await r.json(content_type=None)
-                last_err = f"{r.status} {url}"
-        except Exception as e:
-            last_err = str(e)
+@lru_cache(maxsize=4096)
+def wb_card_urls(nm: int) -> Tuple[Tuple[str, str], ...]:
+    """(basket host, card url) for every basket, in probe order. Cached: a tuple, never mutate."""
+    path = wb_card_path(nm)
+    return tuple((host, _BASKET_ORIGIN[host] + path) for host in _PROBE_ORDER)
+
+def wb_product_url(nm: int) -> str:
+    return _WB_PRODUCT_PREFIX + str(nm) + "/detail.aspx"
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+@dataclass(slots=True)
+class _CachedCard:
+    """Last good card.json response: validators for conditional GET + Cache-Control freshness."""
+    url: str
+    card: dict
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fresh_until: float
+
+# nm -> last response; bounded, oldest entries evicted first
+_CARD_HTTP_CACHE: dict[int, _CachedCard] = {}
+_CARD_HTTP_CACHE_MAX = 4096
+
+def _remember_card(nm: int, url: str, card: dict, headers) -> None:
+    m = _MAX_AGE_RE.search(headers.get("Cache-Control") or "")
+    _CARD_HTTP_CACHE.pop(nm, None)
+    if len(_CARD_HTTP_CACHE) >= _CARD_HTTP_CACHE_MAX:
+        del _CARD_HTTP_CACHE[next(iter(_CARD_HTTP_CACHE))]
+    _CARD_HTTP_CACHE[nm] = _CachedCard(
+        url=url,
+        card=card,
+        etag=headers.get("ETag"),
+        last_modified=headers.get("Last-Modified"),
+        fresh_until=time.monotonic() + (int(m.group(1)) if m else 0),
+    )
+
+# card.json fields wb_extract_title_price reads; the rest of the card is never materialized
+_CARD_FIELDS = ("imt_name", "goods_name", "salePriceU", "priceU")
+_CARD_INT_KEYS = ("salePriceU", "priceU")
+# key -> (quoted key as it appears in the body, value regex)
+_CARD_FAST_RES = {
+    k: (
+        b'"' + k.encode() + b'"',
+        re.compile(rb'"' + k.encode() + (rb'"\s*:\s*(\d+)' if k in _CARD_INT_KEYS else rb'"\s*:\s*"((?:[^"\\]|\\.)*)"')),
+    )
+    for k in _CARD_FIELDS
+}
+
+def _parse_card_fast(raw: bytes) -> Optional[dict]:
+    """
+    The four fields straight from the bytes, or None when that can't be trusted to match a full parse.
+    Every key present must occur exactly once and sit in the top-level object: before it there is
+    only the opening '{' and no '[' (braces inside strings can only cause a false None, never a wrong value).
+    """
+    card = {}
+    for key, (needle, rx) in _CARD_FAST_RES.items():
+        n = raw.count(needle)
+        if n == 0:
             continue
-    raise RuntimeError(f"WB card not found. Last error: {last_err}")
+        m = rx.search(raw)
+        if n != 1 or m is None:
+            return None
+        pos = m.start()
+        if raw.count(b"{", 0, pos) != 1 or raw.find(b"[", 0, pos) != -1:
+            return None
+        if key in _CARD_INT_KEYS:
+            card[key] = int(m.group(1))
+        else:
+            card[key] = orjson.loads(b'"' + m.group(1) + b'"')  # unescape JSON string
+    return card
+
+def _parse_card(raw: bytes) -> dict:
+    """
+    Shallow parse of card.json: _parse_card_fast when it can be trusted and finds a title and a price,
+    otherwise a full orjson parse of which only the top-level fields are kept.
+    Raises orjson.JSONDecodeError on a broken body (fallback path).
+    """
+    card = _parse_card_fast(raw)
+    if card and ("salePriceU" in card or "priceU" in card) and ("imt_name" in card or "goods_name" in card):
+        return card
+
+    full = orjson.loads(raw)
+    if not isinstance(full, dict):
+        return {}
+    return {k: full[k] for k in _CARD_FIELDS if k in full}
+
+WB_PROBE_WIDTH = 5  # baskets requested at once during one card lookup
+
+# nm // 100_000 -> basket host: WB spreads items over baskets by volume range,
+# so one hit warms every item of that range; persisted in CFG.baskets_path
+_BASKET_CACHE: dict[int, str] = {}
+
+def _basket_key(nm: int) -> int:
+    return nm // 100_000
+
+# basket host -> cards found there; the probe order follows it, busiest baskets first.
+# Re-sorted every _RESORT_EVERY hits, counts halved each time so the order keeps up with new baskets
+BASKET_HITS: dict[str, int] = dict.fromkeys(BASKETS, 0)
+_PROBE_ORDER: Tuple[str, ...] = BASKETS
+_RESORT_EVERY = 1000
+_hits_since_sort = 0
+
+def _resort_baskets() -> None:
+    global _PROBE_ORDER
+    order = tuple(sorted(BASKETS, key=lambda h: -BASKET_HITS[h]))  # stable: ties keep basket order
+    if order != _PROBE_ORDER:
+        _PROBE_ORDER = order
+        wb_card_urls.cache_clear()
+        log.info(f"basket probe order: {', '.join(h[7:9] for h in order)}")
+
+def _record_basket_hit(host: str) -> None:
+    global _hits_since_sort
+    BASKET_HITS[host] += 1
+    _hits_since_sort += 1
+    if _hits_since_sort >= _RESORT_EVERY:
+        _hits_since_sort = 0
+        _resort_baskets()
+        for h in BASKET_HITS:
+            BASKET_HITS[h] //= 2
+
+def load_basket_cache(path: str) -> None:
+    try:
+        with open(path, "rb") as f:
+            data = orjson.loads(f.read())
+        _BASKET_CACHE.update({int(k): v for k, v in data.get("vol", {}).items() if v in _BASKET_ORIGIN})
+        BASKET_HITS.update({h: int(n) for h, n in data.get("hits", {}).items() if h in BASKET_HITS})
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError, AttributeError, TypeError) as e:
+        log.warning(f"basket cache not loaded from {path}: {e}")
+        return
+    _resort_baskets()
+    log.info(f"basket cache: {len(_BASKET_CACHE)} volume ranges loaded")
+
+def save_basket_cache(path: str) -> None:
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(orjson.dumps({"vol": {str(k): v for k, v in _BASKET_CACHE.items()}, "hits": BASKET_HITS}))
+        os.replace(tmp, path)
+    except OSError as e:
+        log.warning(f"basket cache not saved to {path}: {e}")
+
+async def save_basket_cache_job():
+    save_basket_cache(CFG.baskets_path)
+
+class AIMDLimiter:
+    """
+    Adaptive cap on in-flight WB requests, TCP congestion control style:
+    +alpha per full window of answers whose average latency is under target,
+    *beta on a slow window, a timeout or 429/502/503 - at most once per target_latency seconds,
+    so one burst of errors costs a single halving; Retry-After pauses new requests (up to max_pause).
+    """
+
+    def __init__(self, start: int = 8, lmin: int = 2, lmax: int = 64, alpha: float = 1.0, beta: float = 0.5,
+                 target_latency: float = 1.5, window: int = 20, max_pause: float = 30.0):
+        self.limit = float(start)
+        self.lmin = lmin
+        self.lmax = lmax
+        self.alpha = alpha
+        self.beta = beta
+        self.target_latency = target_latency
+        self._latencies: deque[float] = deque(maxlen=window)
+        self._in_flight = 0
+        self._cond = asyncio.Condition()
+        self._resume_at = 0.0
+        self._decreased_at = 0.0
+        self.max_pause = max_pause
+
+    async def __aenter__(self):
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._in_flight < int(self.limit))
+            self._in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        async with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def record(self, latency: float, congested: bool = False, retry_after: Optional[float] = None):
+        now = time.monotonic()
+        if retry_after:
+            self._resume_at = max(self._resume_at, now + min(retry_after, self.max_pause))
+        self._latencies.append(latency)
+        full = len(self._latencies) == self._latencies.maxlen
+        if congested or (full and sum(self._latencies) / len(self._latencies) > self.target_latency):
+            if now - self._decreased_at >= self.target_latency:
+                self.limit = max(self.lmin, self.limit * self.beta)
+                self._decreased_at = now
+            self._latencies.clear()
+        elif full:
+            self.limit = min(self.lmax, self.limit + self.alpha)
+            self._latencies.clear()
+
+WB_LIMITER = AIMDLimiter()
+_CONGESTION_STATUSES = (429, 502, 503)
+
+class WbBusyError(Exception):
+    """Basket answered 429/5xx: the card may be there, but not right now."""
+
+    def __init__(self, status: int, url: str, retry_after: Optional[float] = None):
+        super().__init__(f"{status} {url}")
+        self.status = status
+        self.retry_after = retry_after
+
+_WB_BUSY_STATUSES = (429, 500, 502, 503, 504)
+# failures after which we can't say "not found": unreachable or overloaded basket
+_WB_TRANSPORT_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, WbBusyError)
+WB_RETRY_ATTEMPTS = 4
+WB_RETRY_MAX_DELAY = 30  # seconds; a longer Retry-After means give up now, not hold the slot/check lock for it
+
+def _retry_after(headers) -> Optional[float]:
+    v = headers.get("Retry-After")
+    return float(v) if v and v.isdigit() else None
+
+async def _get_card(nm: int, url: str, session: aiohttp.ClientSession, cached: Optional[_CachedCard]) -> Optional[dict]:
+    """One basket request: card (also on 304) or None on miss. Raises on transport errors, WbBusyError on 429/5xx."""
+    async with WB_LIMITER:
+        started = time.monotonic()
+        try:
+            return await _request_card(nm, url, session, cached, started)
+        except asyncio.TimeoutError:
+            WB_LIMITER.record(time.monotonic() - started, congested=True)
+            raise
+
+async def _request_card(nm: int, url: str, session: aiohttp.ClientSession, cached: Optional[_CachedCard],
+                        started: float) -> Optional[dict]:
+    headers = {}
+    if cached is not None and cached.url == url:
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+    async with session.get(url, headers=headers) as r:
+        WB_LIMITER.record(
+            time.monotonic() - started,
+            congested=r.status in _CONGESTION_STATUSES,
+            retry_after=_retry_after(r.headers),
+        )
+        if r.status == 304 and cached is not None:
+            # not modified: keep the parsed card, just extend freshness
+            _remember_card(nm, url, cached.card, {
+                "ETag": r.headers.get("ETag") or cached.etag,
+                "Last-Modified": r.headers.get("Last-Modified") or cached.last_modified,
+                "Cache-Control": r.headers.get("Cache-Control"),
+            })
+            return cached.card
+        if r.status == 200:
+            try:
+                card = _parse_card(await r.read())
+            except orjson.JSONDecodeError:
+                return None  # broken body: treat as a miss
+            _remember_card(nm, url, card, r.headers)
+            return card
+        if r.status in _WB_BUSY_STATUSES:
+            raise WbBusyError(r.status, url, _retry_after(r.headers))
+        return None
+
+async def _get_card_retrying(nm: int, url: str, session: aiohttp.ClientSession,
+                             cached: Optional[_CachedCard]) -> Optional[dict]:
+    """_get_card with exponential backoff + jitter on 429/5xx, honoring Retry-After up to WB_RETRY_MAX_DELAY."""
+    for attempt in range(WB_RETRY_ATTEMPTS):
+        try:
+            return await _get_card(nm, url, session, cached)
+        except WbBusyError as e:
+            delay = e.retry_after if e.retry_after is not None else 2 ** attempt
+            if attempt == WB_RETRY_ATTEMPTS - 1 or delay > WB_RETRY_MAX_DELAY:
+                raise
+            await asyncio.sleep(delay + random.random())
+
+# nm -> lookup in progress, so concurrent callers (sweep, user messages) share one fetch
+_WB_INFLIGHT: dict[int, asyncio.Task] = {}
+
+def _inflight_done(nm: int, task: asyncio.Task) -> None:
+    if _WB_INFLIGHT.get(nm) is task:
+        del _WB_INFLIGHT[nm]
+    if not task.cancelled():
+        task.exception()  # mark as retrieved even if every waiter went away
+
+async def fetch_wb_card(nm: int, session: aiohttp.ClientSession) -> Optional[dict]:
+    """Same as _fetch_wb_card, but concurrent lookups of one nm are coalesced into a single request."""
+    task = _WB_INFLIGHT.get(nm)
+    if task is None:
+        task = asyncio.create_task(_fetch_wb_card(nm, session))
+        _WB_INFLIGHT[nm] = task
+        task.add_done_callback(lambda t: _inflight_done(nm, t))
+    # shield: one caller giving up must not cancel the fetch for the others
+    return await asyncio.shield(task)
+
+async def _fetch_wb_card(nm: int, session: aiohttp.ClientSession) -> Optional[dict]:
+    """
+    Card JSON or None if no basket has it.
+    Raises only on transport errors or 429/5xx (such a basket may be the one holding the card).
+
+    The basket that last answered for this volume range is asked first; otherwise baskets are probed
+    in parallel, WB_PROBE_WIDTH at a time, busiest baskets first; the first hit wins
+    and the remaining requests are cancelled.
+    """
+    cached = _CARD_HTTP_CACHE.get(nm)
+    if cached is not None and cached.fresh_until > time.monotonic():
+        return cached.card
+
+    key = _basket_key(nm)
+    known_host = _BASKET_CACHE.get(key)
+    if known_host is not None:
+        try:
+            card = await _get_card_retrying(nm, _BASKET_ORIGIN[known_host] + wb_card_path(nm), session, cached)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            card = None
+        if card is not None:
+            _record_basket_hit(known_host)
+            return card
+        # missed or unreachable: fall through to the full probe (still busy after retries: give up)
+
+    sem = asyncio.Semaphore(WB_PROBE_WIDTH)
+
+    async def probe(host: str, url: str) -> Optional[dict]:
+        async with sem:
+            card = await _get_card(nm, url, session, cached)
+            if card is not None:
+                _BASKET_CACHE[key] = host
+                _record_basket_hit(host)
+            return card
+
+    tasks = [asyncio.create_task(probe(host, url)) for host, url in wb_card_urls(nm)]
+    transport_err: Optional[Exception] = None
+    try:
+        for fut in asyncio.as_completed(tasks):
+            try:
+                card = await fut
+            except _WB_TRANSPORT_ERRORS as e:
+                transport_err = e
+                continue
+            if card is not None:
+                return card
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    if transport_err is not None:
+        raise transport_err
+    return None
+
+async def fetch_wb_many(session: aiohttp.ClientSession, nms: list[int]) -> dict[int, Optional[dict]]:
+    """
+    Cards for many nm in one call: nm -> card, or None if no basket has the item.
+    Basket CDN has no multi-nm endpoint, so this is a bounded fan-out;
+    nm whose lookup hit a transport failure are logged and left out.
+    """
+    sem = asyncio.Semaphore(CFG.check_concurrency)
+
+    async def one(nm: int):
+        async with sem:
+            try:
+                return nm, await fetch_wb_card(nm, session), True
+            except _WB_TRANSPORT_ERRORS as e:
+                log.warning(f"check failed mp=wb pid={nm} err={e}")
+                return nm, None, False
+
+    results = await asyncio.gather(*(one(nm) for nm in nms))
+    return {nm: card for nm, card, ok in results if ok}
 
 def wb_extract_title_price(card_json: dict) -> Tuple[str, Optional[int]]:
     title = card_json.get("imt_name") or card_json.get("goods_name") or "Товар WB"
     sale_u = card_json.get("salePriceU")
     price_u = card_json.get("priceU")
 
-    price = None
-    if isinstance(sale_u, int):
-        price = sale_u // 100
-    elif isinstance(price_u, int):
-        price = price_u // 100
+    # kopecks: sale price if present, else base price
+    kop = sale_u if isinstance(sale_u, int) else price_u if isinstance(price_u, int) else None
+    return title, (kop // 100 if kop is not None else None)
+
+# nm -> (expires_at, title, price): recent lookups/sweep results, so popular items answer instantly
+_TITLE_PRICE_TTL = 120  # seconds
+_TITLE_PRICE_MAX = 2048
+_TITLE_PRICE_CACHE: dict[int, Tuple[float, str, Optional[int]]] = {}
 
+def remember_title_price(nm: int, title: str, price: Optional[int]) -> None:
+    _TITLE_PRICE_CACHE.pop(nm, None)
+    if len(_TITLE_PRICE_CACHE) >= _TITLE_PRICE_MAX:
+        del _TITLE_PRICE_CACHE[next(iter(_TITLE_PRICE_CACHE))]
+    _TITLE_PRICE_CACHE[nm] = (time.monotonic() + _TITLE_PRICE_TTL, title, price)
+
+async def wb_title_price(nm: int, session: aiohttp.ClientSession) -> Optional[Tuple[str, Optional[int]]]:
+    """(title, price) from the short-lived cache, else from the card; None if WB has no such item."""
+    hit = _TITLE_PRICE_CACHE.get(nm)
+    if hit is not None and hit[0] > time.monotonic():
+        return hit[1], hit[2]
+    card = await fetch_wb_card(nm, session)
+    if card is None:
+        return None
+    title, price = wb_extract_title_price(card)
+    remember_title_price(nm, title, price)
     return title, price
 
 # ----------------------------
 # OZON (stub for now)
 # ----------------------------
+_OZON_PREFIX_RE = re.compile(r"(?i)\bozon\s+(\d{6,12})\b")
+_OZON_TAIL_RE = re.compile(r"-([0-9]{6,12})/?(?:\?|$)")
+
+@lru_cache(maxsize=4096)
 def extract_ozon_id_or_link(text: str) -> Optional[Tuple[str, str]]:
     """
     Returns ("ozon", id_or_unknown) if looks like ozon.
@@ -101,13 +536,17 @@ def extract_ozon_id_or_link(text: str) -> Optional[Tuple[str, str]]:
     if not text:
         return None
     t = text.strip()
+    low = t.lower()
+    # both forms contain "ozon" -> skip the regexes for everything else
+    if "ozon" not in low:
+        return None
 
-    m = re.search(r"(?i)\bozon\s+(\d{6,12})\b", t)
+    m = _OZON_PREFIX_RE.search(t)
     if m:
         return ("ozon", m.group(1))
 
-    if "ozon.ru" in t.lower():
-        m = re.search(r"-([0-9]{6,12})/?(?:\?|$)", t)
+    if "ozon.ru" in low:
+        m = _OZON_TAIL_RE.search(t)
         if m:
             return ("ozon", m.group(1))
         return ("ozon", "unknown")
@@ -129,7 +568,8 @@ CREATE TABLE IF NOT EXISTS watches (
   target_price INTEGER NOT NULL,
   last_price INTEGER,
   active INTEGER NOT NULL DEFAULT 1,
-  created_at TEXT NOT NULL
+  created_at INTEGER NOT NULL, -- unix time (ISO text in databases created before)
+  last_checked_at INTEGER      -- unix time of the last successful check
 );
 
 CREATE INDEX IF NOT EXISTS idx_watches_chat ON watches(chat_id);
@@ -137,105 +577,201 @@ CREATE INDEX IF NOT EXISTS idx_watches_user ON watches(user_id);
 CREATE INDEX IF NOT EXISTS idx_watches_item ON watches(marketplace, product_id);
 """
 
+# columns added after the first release: (name, declaration)
+MIGRATIONS = [
+    ("last_checked_at", "INTEGER"),
+]
+
+# idx_watches_chat needs no id column: id is the rowid, so ORDER BY id DESC is served by it too
+# due_watches walks idx_watches_active_due in order and stops at LIMIT (NULLs sort first)
+INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS idx_watches_active_due ON watches(marketplace, last_checked_at) WHERE active=1;
+"""
+
+# statements used at runtime, kept together so the queries can be read (and matched to the indexes) in one place
+SQL_INSERT = """INSERT INTO watches (user_id, chat_id, marketplace, product_id, url, title, target_price, last_price, active, created_at)
+VALUES (?,?,?,?,?,?,?,?,1,?)"""
+
+SQL_LIST = """SELECT id, marketplace, title, target_price, last_price, active, url
+FROM watches WHERE chat_id=? ORDER BY id DESC"""
+
+SQL_DELETE = "DELETE FROM watches WHERE chat_id=? AND id=?"
+
+SQL_DUE = """SELECT id, user_id, chat_id, marketplace, product_id, url, title, target_price, last_price
+FROM watches
+WHERE active=1 AND marketplace='wb' AND (last_checked_at IS NULL OR last_checked_at < ?)
+ORDER BY last_checked_at
+LIMIT ?"""
+
+SQL_SAVE_CHECK = "UPDATE watches SET last_price=COALESCE(?, last_price), last_checked_at=? WHERE id=?"
+
+SQL_DEACTIVATE = "UPDATE watches SET active=0 WHERE id=?"
+
+# single connection for the whole process (opened in db_init, closed on shutdown)
+DB: Optional[aiosqlite.Connection] = None
+
 async def db_init():
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.executescript(CREATE_SQL)
-        await db.commit()
+    global DB
+    DB = await aiosqlite.connect(CFG.db_path)
+    # WAL needs DB_PATH on a local filesystem (not NFS/SMB)
+    await DB.execute("PRAGMA journal_mode=WAL")
+    await DB.execute("PRAGMA synchronous=NORMAL")
+    await DB.execute("PRAGMA temp_store=MEMORY")
+    await DB.execute("PRAGMA cache_size=-64000")
+    await DB.execute("PRAGMA busy_timeout=5000")
+    await DB.execute("PRAGMA mmap_size=268435456")
+    await DB.execute("PRAGMA wal_autocheckpoint=1000")
+    await DB.executescript(CREATE_SQL)
+    cur = await DB.execute("PRAGMA table_info(watches)")
+    have = {row[1] for row in await cur.fetchall()}
+    for name, decl in MIGRATIONS:
+        if name not in have:
+            await DB.execute(f"ALTER TABLE watches ADD COLUMN {name} {decl}")
+    await DB.executescript(INDEX_SQL)
+    await DB.commit()
+
+async def db_optimize():
+    await DB.execute("PRAGMA optimize")
+
+async def db_close():
+    if DB is not None:
+        await DB.close()
 
 async def add_watch(user_id: int, chat_id: int, marketplace: str, product_id: str, url: str, title: str,
                     target_price: int, last_price: Optional[int]):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            """INSERT INTO watches (user_id, chat_id, marketplace, product_id, url, title, target_price, last_price, active, created_at)
-               VALUES (?,?,?,?,?,?,?,?,1,?)""",
-            (user_id, chat_id, marketplace, product_id, url, title, target_price, last_price, datetime.utcnow().isoformat())
-        )
-        await db.commit()
+    await DB.execute(
+        SQL_INSERT,
+        (user_id, chat_id, marketplace, product_id, url, title, target_price, last_price, int(time.time()))
+    )
+    await DB.commit()
 
 async def list_watches(chat_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute(
-            """SELECT id, marketplace, title, target_price, last_price, active, url
-               FROM watches WHERE chat_id=? ORDER BY id DESC""",
-            (chat_id,)
-        )
-        return await cur.fetchall()
+    cur = await DB.execute(SQL_LIST, (chat_id,))
+    return await cur.fetchall()
 
 async def delete_watch(chat_id: int, watch_id: int) -> bool:
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("DELETE FROM watches WHERE chat_id=? AND id=?", (chat_id, watch_id))
-        await db.commit()
-        return cur.rowcount > 0
-
-async def all_active_watches():
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute(
-            """SELECT id, user_id, chat_id, marketplace, product_id, url, title, target_price, last_price
-               FROM watches WHERE active=1"""
-        )
-        return await cur.fetchall()
+    cur = await DB.execute(SQL_DELETE, (chat_id, watch_id))
+    await DB.commit()
+    return cur.rowcount > 0
 
-async def update_last_price(watch_id: int, new_price: Optional[int]):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("UPDATE watches SET last_price=? WHERE id=?", (new_price, watch_id))
-        await db.commit()
+async def due_watches(now: int, limit: int = CFG.check_batch_limit):
+    """
+    Active WB watches not checked during the last half-interval,
+    never-checked and oldest first. Ozon is not monitored yet, so it's left out.
+    """
+    cutoff = now - CFG.check_interval_minutes * 60 // 2
+    cur = await DB.execute(SQL_DUE, (cutoff, limit))
+    return await cur.fetchall()
 
-async def deactivate_watch(watch_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("UPDATE watches SET active=0 WHERE id=?", (watch_id,))
-        await db.commit()
+async def save_check_results(updates: list[Tuple[Optional[int], int, int]], deactivations: list[int]):
+    """
+    Everything a scheduler tick writes, in one transaction / one commit:
+    updates: [(new_price, checked_at, watch_id), ...], deactivations: [watch_id, ...]
+    """
+    if not updates and not deactivations:
+        return
+    await DB.executemany(SQL_SAVE_CHECK, updates)
+    await DB.executemany(SQL_DEACTIVATE, [(wid,) for wid in deactivations])
+    await DB.commit()
 
 # ----------------------------
 # BOT + STATE
 # ----------------------------
 dp = Dispatcher()
-bot = Bot(BOT_TOKEN)  # IMPORTANT: no parse_mode=HTML to avoid <id> issues
+bot = Bot(CFG.bot_token)  # IMPORTANT: no parse_mode=HTML to avoid <id> issues
+
+# abandoned flows expire: ignored on lookup after PENDING_TTL, swept by prune_pending() every 10 minutes
+PENDING_TTL = 900  # seconds
+PENDING_MAX = 10_000  # hard cap: link spam without a price reply can't grow memory past this
+
+@dataclass(slots=True)
+class PendingProduct:
+    """Product found by link/article, waiting for the user's target price."""
+    marketplace: str
+    product_id: str
+    url: str
+    title: str
+    last_price: Optional[int] = None
+    created: float = field(default_factory=time.monotonic)
 
-# pending: user_id -> dict with product data, waiting for target price
-PENDING = {}
+# pending: user_id -> product waiting for target price
+# insertion order == creation order (pending_put re-inserts), so the first key is always the oldest
+PENDING: dict[int, PendingProduct] = {}
+
+def pending_put(uid: int, p: PendingProduct):
+    PENDING.pop(uid, None)
+    if len(PENDING) >= PENDING_MAX:
+        oldest = next(iter(PENDING))
+        del PENDING[oldest]
+        log.warning(f"pending: full ({PENDING_MAX}), evicted user {oldest}")
+    PENDING[uid] = p
+
+def pending_get(uid: int) -> Optional[PendingProduct]:
+    p = PENDING.get(uid)
+    if p is not None and p.created < time.monotonic() - PENDING_TTL:
+        del PENDING[uid]
+        return None
+    return p
+
+async def prune_pending():
+    cutoff = time.monotonic() - PENDING_TTL
+    stale = [uid for uid, p in PENDING.items() if p.created < cutoff]
+    for uid in stale:
+        del PENDING[uid]
+    if stale:
+        log.info(f"pending: dropped {len(stale)} abandoned entries")
+
+# separators users type inside prices: "4 990", "4.990", NBSP from copy-paste
+_PRICE_STRIP = str.maketrans("", "", " .\u00a0")
 
 def parse_price(text: str) -> Optional[int]:
     if not text:
         return None
-    t = text.strip().replace(" ", "").replace(".", "")
-    if not t.isdigit():
+    t = text.strip().translate(_PRICE_STRIP)
+    if not (t.isascii() and t.isdigit()):
         return None
     v = int(t)
     if v <= 0:
         return None
     return v
 
+START_TEXT = (
+    "Привет! Я бот «ОхотаНаСкидки» 🦆\n\n"
+    "Пришли ссылку или артикул:\n"
+    "• Wildberries: 546168907 или ссылка\n"
+    "• Ozon: ozon 123456789 или ссылка\n\n"
+    "Я спрошу цену, которую хочешь дождаться, и буду мониторить.\n\n"
+    "Команды:\n"
+    "/list — список подписок\n"
+    "/remove 12 — удалить подписку\n"
+    "/help — помощь"
+)
+
+HELP_TEXT = (
+    "Как пользоваться:\n"
+    "1) Пришли артикул WB или ссылку\n"
+    "2) Я покажу текущую цену и попрошу «цель»\n"
+    "3) Напиши цену числом (например 4990)\n"
+    "4) Я проверяю каждые N минут и уведомляю\n\n"
+    "Примеры:\n"
+    "• 546168907\n"
+    "• 546168907 (wb)\n"
+    "• https://www.wildberries.ru/catalog/546168907/detail.aspx\n"
+    "• ozon 123456789\n\n"
+    "Команды:\n"
+    "/list\n"
+    "/remove 12"
+)
+
 @dp.message(CommandStart())
 async def start(m: Message):
-    await m.answer(
-        "Привет! Я бот «ОхотаНаСкидки» 🦆\n\n"
-        "Пришли ссылку или артикул:\n"
-        "• Wildberries: 546168907 или ссылка\n"
-        "• Ozon: ozon 123456789 или ссылка\n\n"
-        "Я спрошу цену, которую хочешь дождаться, и буду мониторить.\n\n"
-        "Команды:\n"
-        "/list — список подписок\n"
-        "/remove 12 — удалить подписку\n"
-        "/help — помощь"
-    )
+    await m.answer(START_TEXT)
 
 @dp.message(Command("help"))
 async def help_cmd(m: Message):
-    await m.answer(
-        "Как пользоваться:\n"
-        "1) Пришли артикул WB или ссылку\n"
-        "2) Я покажу текущую цену и попрошу «цель»\n"
-        "3) Напиши цену числом (например 4990)\n"
-        "4) Я проверяю каждые N минут и уведомляю\n\n"
-        "Примеры:\n"
-        "• 546168907\n"
-        "• 546168907 (wb)\n"
-        "• https://www.wildberries.ru/catalog/546168907/detail.aspx\n"
-        "• ozon 123456789\n\n"
-        "Команды:\n"
-        "/list\n"
-        "/remove 12"
-    )
+    await m.answer(HELP_TEXT)
+
+_LIST_ROW = "{status} ID {wid} | {mp} | цель: {target} ₽ | последняя: {last}\n{title}\n{url}"
 
 @dp.message(Command("list"))
 async def list_cmd(m: Message):
@@ -243,11 +779,21 @@ async def list_cmd(m: Message):
     if not rows:
         await m.answer("Подписок пока нет. Пришли ссылку WB/Ozon или артикул 🙂")
         return
-    lines = ["Твои подписки:"]
-    for (wid, mp, title, target, last, active, url) in rows:
-        status = "✅" if active == 1 else "⏸"
-        last_txt = f"{last} ₽" if last is not None else "—"
-        lines.append(f"{status} ID {wid} | {mp.upper()} | цель: {target} ₽ | последняя: {last_txt}\n{title}\n{url}")
+    lines = [
+        "Твои подписки:",
+        *(
+            _LIST_ROW.format(
+                status="✅" if active == 1 else "⏸",
+                wid=wid,
+                mp=mp.upper(),
+                target=target,
+                last=f"{last} ₽" if last is not None else "—",
+                title=title,
+                url=url,
+            )
+            for (wid, mp, title, target, last, active, url) in rows
+        ),
+    ]
     await m.answer("\n\n".join(lines))
 
 @dp.message(Command("remove"))
@@ -266,25 +812,26 @@ async def on_text(m: Message):
     uid = m.from_user.id
 
     # If waiting for target price
-    if uid in PENDING:
+    p = pending_get(uid)
+    if p is not None:
         target = parse_price(text)
         if target is None:
             await m.answer("Напиши цену числом (например 4990).")
             return
-        p = PENDING.pop(uid)
+        del PENDING[uid]
         await add_watch(
             user_id=uid,
             chat_id=m.chat.id,
-            marketplace=p["marketplace"],
-            product_id=p["product_id"],
-            url=p["url"],
-            title=p["title"],
+            marketplace=p.marketplace,
+            product_id=p.product_id,
+            url=p.url,
+            title=p.title,
             target_price=target,
-            last_price=p.get("last_price"),
+            last_price=p.last_price,
         )
         await m.answer(
-            f"✅ Добавил!\n{p['marketplace'].upper()}: {p['title']}\n"
-            f"Цель: {target} ₽\nПроверка каждые {CHECK_INTERVAL_MINUTES} минут.\n\n"
+            f"✅ Добавил!\n{p.marketplace.upper()}: {p.title}\n"
+            f"Цель: {target} ₽\nПроверка каждые {CFG.check_interval_minutes} минут.\n\n"
             f"/list — посмотреть подписки"
         )
         return
@@ -293,18 +840,20 @@ async def on_text(m: Message):
     nm = extract_wb_nm(text)
     if nm:
         try:
-            async with aiohttp.ClientSession() as session:
-                card = await fetch_wb_card(nm, session)
-                title, price = wb_extract_title_price(card)
-
-            url = f"https://www.wildberries.ru/catalog/{nm}/detail.aspx"
-            PENDING[uid] = {
-                "marketplace": "wb",
-                "product_id": str(nm),
-                "url": url,
-                "title": title,
-                "last_price": price,
-            }
+            found = await wb_title_price(nm, SESSION)
+            if found is None:
+                await m.answer("WB товар не найден 😕\nПроверь артикул/ссылку и пришли ещё раз.")
+                return
+            title, price = found
+
+            url = wb_product_url(nm)
+            pending_put(uid, PendingProduct(
+                marketplace="wb",
+                product_id=str(nm),
+                url=url,
+                title=title,
+                last_price=price,
+            ))
 
             if price is not None:
                 await m.answer(
@@ -327,13 +876,12 @@ async def on_text(m: Message):
         url = text if "ozon.ru" in text.lower() else f"ozon {ozid}"
         title = f"Ozon товар {ozid}"
 
-        PENDING[uid] = {
-            "marketplace": "ozon",
-            "product_id": ozid,
-            "url": url,
-            "title": title,
-            "last_price": None
-        }
+        pending_put(uid, PendingProduct(
+            marketplace="ozon",
+            product_id=ozid,
+            url=url,
+            title=title,
+        ))
         await m.answer(
             f"✅ Ozon распознал: {ozid}\n"
             "Сейчас мониторинг цены включён для WB.\n"
@@ -347,46 +895,161 @@ async def on_text(m: Message):
 # ----------------------------
 # SCHEDULER
 # ----------------------------
+# Telegram allows ~30 msg/s per bot; stay a bit below for every outgoing alert
+TG_LIMITER = AsyncLimiter(25, 1)
+
+class ChatRateLimiter:
+    """
+    Per-chat pacing on top of TG_LIMITER: at most one message per `interval` seconds to one chat.
+    Each acquire() reserves the chat's next free slot before sleeping, so concurrent alerts
+    to the same chat line up one interval apart instead of bursting into a 429.
+    """
+
+    def __init__(self, interval: float = 1.0, max_chats: int = 4096):
+        self.interval = interval
+        self.max_chats = max_chats
+        self._next_at: dict[int, float] = {}  # chat_id -> earliest time of the next message
+
+    async def acquire(self, chat_id: int):
+        now = time.monotonic()
+        if len(self._next_at) >= self.max_chats:
+            self._next_at = {c: t for c, t in self._next_at.items() if t > now}
+        at = max(now, self._next_at.get(chat_id, 0.0))
+        self._next_at[chat_id] = at + self.interval
+        if at > now:
+            await asyncio.sleep(at - now)
+
+CHAT_LIMITER = ChatRateLimiter()
+
+def _apply_card(nm: int, card: dict, rows: list, updates: list, notifications: list):
+    """Collects price updates and pending notifications for every watcher of one product."""
+    new_title, new_price = wb_extract_title_price(card)
+    remember_title_price(nm, new_title, new_price)
+    now = int(time.time())
+
+    for (wid, user_id, chat_id, mp, pid, url, title, target, last_price) in rows:
+        updates.append((new_price, now, wid))
+        # notify when crossed target downward
+        if new_price is not None and new_price <= int(target):
+            notifications.append((
+                wid,
+                chat_id,
+                f"🔥 Цена достигнута!\n{new_title or title}\n"
+                f"Сейчас: {new_price} ₽ (цель: {target} ₽)\n{url}\n\n"
+                f"Подписка отключена (ID {wid})."
+            ))
+
+async def send_alert(chat_id: int, text: str):
+    """bot.send_message under the per-chat and global rate limits; one retry after Telegram's RetryAfter."""
+    await CHAT_LIMITER.acquire(chat_id)
+    async with TG_LIMITER:
+        try:
+            await bot.send_message(chat_id, text)
+            return
+        except TelegramRetryAfter as e:
+            retry_after = e.retry_after
+    await asyncio.sleep(retry_after)
+    async with TG_LIMITER:
+        await bot.send_message(chat_id, text)
+
+async def _notify(wid: int, chat_id: int, text: str) -> Optional[int]:
+    """Returns watch id if the message was delivered."""
+    try:
+        await send_alert(chat_id, text)
+        return wid
+    except Exception as e:
+        log.warning(f"notify failed id={wid} chat={chat_id} err={e}")
+        return None
+
 async def check_prices():
-    rows = await all_active_watches()
+    rows = await due_watches(int(time.time()))
     if not rows:
         return
 
-    async with aiohttp.ClientSession() as session:
-        for (wid, user_id, chat_id, mp, pid, url, title, target, last_price) in rows:
-            try:
-                if mp == "wb":
-                    nm = int(pid)
-                    card = await fetch_wb_card(nm, session)
-                    new_title, new_price = wb_extract_title_price(card)
-                    if new_title:
-                        title = new_title
-                    if new_price is None:
-                        continue
-
-                    await update_last_price(wid, new_price)
-
-                    # notify when crossed target downward
-                    if new_price <= int(target):
-                        await bot.send_message(
-                            chat_id,
-                            f"🔥 Цена достигнута!\n{title}\n"
-                            f"Сейчас: {new_price} ₽ (цель: {target} ₽)\n{url}\n\n"
-                            f"Подписка отключена (ID {wid})."
-                        )
-                        await deactivate_watch(wid)
-
-                # OZON пока пропускаем
-                else:
-                    continue
-
-            except Exception as e:
-                log.warning(f"check failed id={wid} mp={mp} err={e}")
+    # due_watches returns WB only (OZON пока пропускаем);
+    # same product watched by several users -> fetch it once, nm parsed once per product
+    groups: dict[int, list] = {}
+    for row in rows:
+        groups.setdefault(int(row[4]), []).append(row)
+
+    cards = await fetch_wb_many(SESSION, list(groups))
+
+    updates: list[Tuple[Optional[int], int, int]] = []
+    notifications: list[Tuple[int, int, str]] = []
+    now = int(time.time())
+    for nm, group in groups.items():
+        if nm not in cards:
+            continue  # transport failure: stays due, retried next tick
+        card = cards[nm]
+        if card is None:
+            # not on any basket: mark checked (COALESCE keeps last_price) so dead items can't fill every batch
+            updates.extend((None, now, row[0]) for row in group)
+        else:
+            _apply_card(nm, card, group, updates, notifications)
+
+    # send alerts in parallel; a watch is switched off only if its alert got through
+    sent = await asyncio.gather(*(_notify(*n) for n in notifications))
+    deactivations = [wid for wid in sent if wid is not None]
+
+    # all writes of the tick in one commit
+    await save_check_results(updates, deactivations)
+
+# one check at a time (what max_instances=1 did with APScheduler)
+_CHECK_LOCK = asyncio.Lock()
+
+async def locked_check_prices():
+    async with _CHECK_LOCK:
+        await check_prices()
+
+# set on shutdown: periodic jobs finish the current run and exit
+STOP = asyncio.Event()
+
+async def _periodic(fn, interval: float):
+    """
+    Runs fn() every `interval` seconds (first run right away) until STOP is set.
+    Runs are scheduled on a fixed grid, so a slow run doesn't push later ones back;
+    errors are logged, never kill the loop.
+    """
+    loop = asyncio.get_running_loop()
+    next_run = loop.time()
+    while not STOP.is_set():
+        try:
+            await fn()
+        except Exception:
+            log.exception(f"periodic job {fn.__name__} failed")
+        next_run += interval
+        if next_run < loop.time():  # overran a whole interval: skip missed runs
+            next_run = loop.time()
+        try:
+            await asyncio.wait_for(STOP.wait(), timeout=next_run - loop.time())
+        except asyncio.TimeoutError:
+            pass
 
 # ----------------------------
 # HEALTH SERVER (Render Web Service needs open port)
 # ----------------------------
-async def start_http_server():
+_PROBE_OK = b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nContent-Length: 2\r\nConnection: close\r\n\r\nOK"
+_PROBE_HEALTH = (
+    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: 11\r\nConnection: close\r\n\r\n"
+    b'{"ok":true}'
+)
+
+async def _probe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """One request per connection: /health -> {"ok":true}, anything else -> OK."""
+    try:
+        line = await asyncio.wait_for(reader.readline(), timeout=5)
+        writer.write(_PROBE_HEALTH if line.startswith(b"GET /health") else _PROBE_OK)
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError, ValueError):  # ValueError: request line over the 64 KiB limit
+        pass
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+async def start_aiohttp_server():
     app = web.Application()
 
     async def health(_request):
@@ -400,26 +1063,67 @@ async def start_http_server():
 
     runner = web.AppRunner(app)
     await runner.setup()
-    site = web.TCPSite(runner, "0.0.0.0", PORT)
+    site = web.TCPSite(runner, "0.0.0.0", CFG.port)
     await site.start()
-    log.info(f"HTTP server listening on :{PORT}")
+
+# the bare listener; kept referenced for the process lifetime
+_PROBE_SERVER: Optional[asyncio.Server] = None
+
+async def start_http_server():
+    global _PROBE_SERVER
+    if CFG.health_server == "aiohttp":
+        await start_aiohttp_server()
+    else:
+        _PROBE_SERVER = await asyncio.start_server(_probe, "0.0.0.0", CFG.port)
+    log.info(f"HTTP server ({CFG.health_server}) listening on :{CFG.port}")
 
 # ----------------------------
 # ENTRYPOINT
 # ----------------------------
 async def main():
+    global SESSION
     await db_init()
+    load_basket_cache(CFG.baskets_path)
+
+    SESSION = aiohttp.ClientSession(
+        headers={"User-Agent": UA, "Accept-Encoding": "gzip, deflate, br"},  # br needs Brotli installed
+        timeout=aiohttp.ClientTimeout(total=12),  # per basket request
+        connector=aiohttp.TCPConnector(
+            limit=64,
+            limit_per_host=16,
+            ttl_dns_cache=300,
+            use_dns_cache=True,
+            keepalive_timeout=60,
+            resolver=AsyncResolver(),  # aiodns: no thread-pool getaddrinfo per basket host
+        ),
+    )
 
     # Start HTTP server so Render sees an open port
     await start_http_server()
 
     # Scheduler
-    scheduler = AsyncIOScheduler()
-    scheduler.add_job(check_prices, "interval", minutes=CHECK_INTERVAL_MINUTES, max_instances=1)
-    scheduler.start()
+    jobs = [
+        asyncio.create_task(_periodic(locked_check_prices, CFG.check_interval_minutes * 60)),
+        asyncio.create_task(_periodic(prune_pending, 10 * 60)),
+        asyncio.create_task(_periodic(save_basket_cache_job, 10 * 60)),
+        asyncio.create_task(_periodic(db_optimize, 60 * 60)),
+    ]
 
-    log.info(f"Bot started. Interval={CHECK_INTERVAL_MINUTES} minutes")
-    await dp.start_polling(bot)
+    log.info(f"Bot started. Interval={CFG.check_interval_minutes} minutes")
+    try:
+        await dp.start_polling(bot)
+    finally:
+        STOP.set()
+        _, unfinished = await asyncio.wait(jobs, timeout=10)
+        for job in unfinished:
+            job.cancel()
+        await asyncio.gather(*jobs, return_exceptions=True)
+        save_basket_cache(CFG.baskets_path)
+        await SESSION.close()
+        await db_close()
 
 if __name__ == "__main__":
+    if sys.platform != "win32":
+        import uvloop  # libuv-based loop; not installed on Windows (see requirements.txt)
+        uvloop.install()
     asyncio.run(main())